@@ -0,0 +1,133 @@
+"""
+内容寻址缓存模块
+以SHA-256哈希为键的内存+磁盘两级缓存，用于复用Whisper转录和LLM总结结果
+"""
+import aiofiles
+import hashlib
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+async def hash_file_async(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    按块异步计算文件内容的SHA-256哈希
+
+    通过aiofiles在线程池中读取，事件循环在磁盘I/O期间
+    可以继续处理其他请求。
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数（默认1MiB，内存占用恒定）
+
+    Returns:
+        十六进制哈希字符串
+    """
+    digest = hashlib.sha256()
+    async with aiofiles.open(file_path, 'rb') as f:
+        while chunk := await f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(*parts: str) -> str:
+    """
+    计算若干文本片段拼接后的SHA-256哈希
+
+    Args:
+        parts: 参与哈希的文本片段（如模型名、提示词、正文）
+
+    Returns:
+        十六进制哈希字符串
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        # 分隔符避免不同切分方式产生相同哈希
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """内存+磁盘两级缓存"""
+
+    def __init__(self, cache_dir: str = "./.cache", memory_size: int = 256):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 磁盘缓存目录
+            memory_size: 内存层最多保留的条目数（LRU淘汰）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()
+        logger.info(f"初始化SummaryCache，磁盘目录: {self.cache_dir}")
+
+    def _file_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.txt"
+
+    def get(self, namespace: str, content_hash: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            namespace: 命名空间（如 whisper / llm）
+            content_hash: 内容哈希
+
+        Returns:
+            缓存的文本，未命中返回None
+        """
+        key = f"{namespace}_{content_hash}"
+
+        # 内存层
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            logger.info(f"缓存命中（内存）: {key[:24]}...")
+            return self._memory[key]
+
+        # 磁盘层
+        cache_file = self._file_for(key)
+        if cache_file.exists():
+            try:
+                value = cache_file.read_text(encoding='utf-8')
+                self._remember(key, value)
+                logger.info(f"缓存命中（磁盘）: {key[:24]}...")
+                return value
+            except OSError as e:
+                logger.warning(f"读取磁盘缓存失败 {cache_file}: {str(e)}")
+
+        return None
+
+    def set(self, namespace: str, content_hash: str, value: str) -> None:
+        """
+        写入缓存（同时写入内存层和磁盘层）
+
+        Args:
+            namespace: 命名空间（如 whisper / llm）
+            content_hash: 内容哈希
+            value: 要缓存的文本
+        """
+        key = f"{namespace}_{content_hash}"
+        self._remember(key, value)
+
+        cache_file = self._file_for(key)
+        try:
+            # 先写临时文件再改名，避免并发读到半成品
+            tmp_file = cache_file.with_suffix('.tmp')
+            tmp_file.write_text(value, encoding='utf-8')
+            tmp_file.replace(cache_file)
+        except OSError as e:
+            logger.warning(f"写入磁盘缓存失败 {cache_file}: {str(e)}")
+
+    def _remember(self, key: str, value: str) -> None:
+        """写入内存层并按LRU淘汰最旧条目"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
@@ -2,151 +2,308 @@
 LLM对话客户端模块
 用于调用LiteLLM API生成文本总结
 """
-import requests
+import asyncio
+import httpx
 import logging
+import msgspec
+import orjson
+import random
 from typing import Optional, List, Dict
 
+from cache import SummaryCache, hash_text
+
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
+class _ChatMessage(msgspec.Struct):
+    """OpenAI格式响应中的message字段"""
+    content: str
+
+
+class _ChatChoice(msgspec.Struct):
+    """OpenAI格式响应中的choice条目"""
+    message: _ChatMessage
+
+
+class _ChatResponse(msgspec.Struct):
+    """OpenAI格式的chat completion响应"""
+    choices: List[_ChatChoice]
+
+
 class LLMClient:
     """LiteLLM API客户端"""
-    
+
     def __init__(
-        self, 
-        base_url: str, 
-        api_key: str, 
+        self,
+        base_url: str,
+        api_key: str,
         model: str = "gpt-4o",
         default_prompt: str = "",
-        timeout: int = 60
+        timeout: int = 60,
+        max_parallel: int = 4,
+        cache: Optional[SummaryCache] = None,
+        connect_timeout: int = 5,
+        max_retries: int = 3
     ):
         """
         初始化LLM客户端
-        
+
         Args:
             base_url: LiteLLM服务的基础URL
             api_key: API密钥
             model: 使用的模型名称
             default_prompt: 默认的系统提示词
             timeout: 请求超时时间（秒）
+            max_parallel: 长文本分块总结时的最大并发请求数
+            cache: 总结结果缓存（以模型+提示词+正文哈希为键），None则不缓存
+            connect_timeout: 建立连接的超时时间（秒），远小于读超时
+            max_retries: 连接/超时类错误的最大尝试次数
         """
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.model = model
         self.default_prompt = default_prompt
         self.timeout = timeout
+        self.max_parallel = max_parallel
+        self.cache = cache
+        # 至少尝试一次，配置为0/负数时不会出现"零次尝试"的无效状态
+        self.max_retries = max(1, max_retries)
+        # 持久连接池：复用TCP/TLS连接，HTTP/2多路复用，避免每次请求重新握手
+        # 连接超时收紧到秒级，坏节点快速失败后走重试而非拖满整个读超时
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+            http2=True
+        )
         logger.info(f"初始化LLMClient，服务地址: {self.base_url}, 模型: {self.model}")
-    
-    def summarize(
-        self, 
-        text: str, 
+
+    async def aclose(self):
+        """关闭底层HTTP连接池"""
+        await self._client.aclose()
+
+    async def summarize(
+        self,
+        text: str,
         custom_prompt: Optional[str] = None,
         system_message: Optional[str] = None
     ) -> Optional[str]:
         """
         使用LLM生成文本总结
-        
+
         Args:
             text: 需要总结的文本内容
             custom_prompt: 自定义提示词（将与文本拼接作为用户消息）
             system_message: 自定义系统消息（覆盖default_prompt）
-            
+
         Returns:
             生成的总结内容，失败返回None
         """
         if not text or not text.strip():
             logger.error("输入文本为空")
             return None
-        
+
         logger.info(f"开始生成总结，输入文本长度: {len(text)}字符")
-        
-        try:
-            # 构建请求URL
-            url = f"{self.base_url}/v1/chat/completions"
-            
-            # 构建消息列表
+
+        # 以模型+提示词+正文的哈希为键查询缓存，相同请求直接复用结果
+        text_hash = None
+        if self.cache:
+            text_hash = hash_text(
+                self.model,
+                system_message or self.default_prompt,
+                custom_prompt or "",
+                text
+            )
+            cached = self.cache.get("llm", text_hash)
+            if cached:
+                return cached
+
+        # 构建消息列表
+        messages: List[Dict[str, str]] = []
+
+        # 添加系统消息
+        sys_msg = system_message if system_message else self.default_prompt
+        if sys_msg:
+            messages.append({
+                "role": "system",
+                "content": sys_msg
+            })
+
+        # 添加用户消息（join一次性拼接，避免+=对长转录文本的反复整体拷贝）
+        parts = []
+        if custom_prompt:
+            parts.append(custom_prompt)
+            parts.append("\n\n")
+        parts.append("以下是需要总结的内容：\n\n")
+        parts.append(text)
+        user_content = "".join(parts)
+
+        messages.append({
+            "role": "user",
+            "content": user_content
+        })
+
+        summary = await self.chat(messages)
+        if summary:
+            logger.info(f"成功生成总结，长度: {len(summary)}字符")
+            if self.cache and text_hash:
+                self.cache.set("llm", text_hash, summary)
+        return summary
+
+    @staticmethod
+    def _split_text(text: str, chunk_chars: int) -> List[str]:
+        """
+        将长文本按字符数切分为分块，尽量在换行或句号处断开
+
+        Args:
+            text: 待切分的文本
+            chunk_chars: 每个分块的目标字符数
+
+        Returns:
+            分块列表（按顺序）
+        """
+        chunks = []
+        start = 0
+        length = len(text)
+
+        while start < length:
+            end = min(start + chunk_chars, length)
+
+            # 在分块末尾附近寻找自然断点，避免句子被拦腰截断
+            if end < length:
+                window = text[start:end]
+                for sep in ('\n', '。', '！', '？', '，'):
+                    pos = window.rfind(sep)
+                    if pos > chunk_chars // 2:
+                        end = start + pos + 1
+                        break
+
+            chunks.append(text[start:end])
+            start = end
+
+        return chunks
+
+    async def summarize_long(
+        self,
+        text: str,
+        custom_prompt: Optional[str] = None,
+        system_message: Optional[str] = None,
+        chunk_chars: int = 3000
+    ) -> Optional[str]:
+        """
+        对长文本做map-reduce式总结
+
+        先将文本切分为分块并发请求分段总结（map），再对分段总结
+        做一次合并总结（reduce），把串行的单次长请求变为N路并发。
+
+        Args:
+            text: 需要总结的文本内容
+            custom_prompt: 自定义提示词（用于最终reduce阶段）
+            system_message: 自定义系统消息（覆盖default_prompt）
+            chunk_chars: 每个分块的目标字符数
+
+        Returns:
+            生成的总结内容，失败返回None
+        """
+        if not text or not text.strip():
+            logger.error("输入文本为空")
+            return None
+
+        # 与summarize同键查询缓存：命中时整个map-reduce（N次分块调用）都省掉
+        text_hash = None
+        if self.cache:
+            text_hash = hash_text(
+                self.model,
+                system_message or self.default_prompt,
+                custom_prompt or "",
+                text
+            )
+            cached = self.cache.get("llm", text_hash)
+            if cached:
+                return cached
+
+        chunks = self._split_text(text, chunk_chars)
+        if len(chunks) <= 1:
+            return await self.summarize(text, custom_prompt, system_message)
+
+        logger.info(f"长文本总结：共{len(chunks)}个分块，最大并发{self.max_parallel}")
+
+        sys_msg = system_message if system_message else self.default_prompt
+        # 信号量限制并发，避免触发服务端限流（429）
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        async def _summarize_chunk(index: int, chunk: str) -> Optional[str]:
             messages: List[Dict[str, str]] = []
-            
-            # 添加系统消息
-            sys_msg = system_message if system_message else self.default_prompt
             if sys_msg:
-                messages.append({
-                    "role": "system",
-                    "content": sys_msg
-                })
-            
-            # 添加用户消息
-            user_content = custom_prompt if custom_prompt else ""
-            if user_content:
-                user_content += "\n\n"
-            user_content += f"以下是需要总结的内容：\n\n{text}"
-            
+                messages.append({"role": "system", "content": sys_msg})
             messages.append({
                 "role": "user",
-                "content": user_content
+                "content": (
+                    f"以下是一段长文本的第{index + 1}/{len(chunks)}部分，"
+                    f"请提取该部分的要点：\n\n{chunk}"
+                )
             })
-            
-            # 构建请求数据
-            data = {
-                "model": self.model,
-                "messages": messages
-            }
-            
-            # 构建请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            logger.debug(f"发送请求到: {url}")
-            logger.debug(f"消息数量: {len(messages)}")
-            
-            # 发送请求
-            response = requests.post(
-                url,
-                json=data,
-                headers=headers,
-                timeout=self.timeout
-            )
-            
-            # 检查响应状态
-            response.raise_for_status()
-            
-            # 解析JSON响应
-            result = response.json()
-            logger.debug(f"API响应: {result}")
-            
-            # 提取总结内容
-            # OpenAI格式的响应：choices[0].message.content
-            if 'choices' in result and len(result['choices']) > 0:
-                choice = result['choices'][0]
-                if 'message' in choice and 'content' in choice['message']:
-                    summary = choice['message']['content']
-                    logger.info(f"成功生成总结，长度: {len(summary)}字符")
-                    return summary
-            
-            logger.warning(f"无法从响应中提取总结内容: {result}")
-            return None
-            
-        except requests.exceptions.Timeout:
-            logger.error(f"请求超时（{self.timeout}秒）")
-            return None
-        except requests.exceptions.RequestException as e:
-            logger.error(f"请求失败: {str(e)}")
-            if hasattr(e.response, 'text'):
-                logger.error(f"响应内容: {e.response.text}")
-            return None
-        except Exception as e:
-            logger.error(f"生成总结过程发生错误: {str(e)}")
+            async with semaphore:
+                return await self.chat(messages)
+
+        chunk_summaries = await asyncio.gather(
+            *[_summarize_chunk(i, c) for i, c in enumerate(chunks)]
+        )
+
+        valid_summaries = [s for s in chunk_summaries if s]
+        if not valid_summaries:
+            logger.error("所有分块总结均失败")
             return None
-    
-    def chat(
+
+        if len(valid_summaries) < len(chunks):
+            logger.warning(
+                f"部分分块总结失败（{len(chunks) - len(valid_summaries)}/{len(chunks)}），"
+                "将基于成功的分块生成最终总结"
+            )
+
+        # reduce阶段：合并各分块的要点生成最终总结
+        merged = "\n\n".join(valid_summaries)
+        reduce_text = f"以下是同一内容各部分的分段要点，请合并生成一份完整总结：\n\n{merged}"
+
+        summary = await self.summarize(reduce_text, custom_prompt, system_message)
+        if summary:
+            logger.info(f"长文本总结完成，长度: {len(summary)}字符")
+            if self.cache and text_hash:
+                self.cache.set("llm", text_hash, summary)
+        return summary
+
+    async def _post_with_retry(self, url: str, **kwargs) -> httpx.Response:
+        """
+        带退避重试的POST请求
+
+        连接失败和超时类错误指数退避加随机抖动后重试，
+        避免单个慢节点把整条流水线拖到完整读超时。
+
+        Args:
+            url: 请求URL
+            kwargs: 透传给httpx的请求参数
+
+        Returns:
+            httpx响应对象（重试耗尽后抛出最后一次异常）
+        """
+        last_exc = None
+        for attempt in range(self.max_retries):
+            try:
+                return await self._client.post(url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout,
+                    httpx.ReadTimeout, httpx.PoolTimeout) as e:
+                last_exc = e
+                if attempt + 1 >= self.max_retries:
+                    break
+                delay = min(2 ** attempt, 8) + random.uniform(0, 1)
+                logger.warning(
+                    f"请求失败（{type(e).__name__}），{delay:.1f}秒后重试 "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                await asyncio.sleep(delay)
+        raise last_exc
+
+    async def chat(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
@@ -154,54 +311,67 @@ class LLMClient:
     ) -> Optional[str]:
         """
         通用的聊天接口
-        
+
         Args:
             messages: 消息列表，格式: [{"role": "user/assistant/system", "content": "..."}]
             temperature: 温度参数，控制随机性
             max_tokens: 最大生成token数
-            
+
         Returns:
             模型的回复内容，失败返回None
         """
         if not messages:
             logger.error("消息列表为空")
             return None
-        
+
         try:
             url = f"{self.base_url}/v1/chat/completions"
-            
+
             data = {
                 "model": self.model,
                 "messages": messages,
                 "temperature": temperature
             }
-            
+
             if max_tokens:
                 data["max_tokens"] = max_tokens
-            
+
             headers = {
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {self.api_key}"
             }
-            
-            logger.debug(f"发送聊天请求，消息数: {len(messages)}")
-            
-            response = requests.post(
+
+            logger.debug("发送聊天请求，消息数: %s", len(messages))
+
+            # orjson序列化/反序列化比标准库json快数倍，长转录文本收益明显
+            response = await self._post_with_retry(
                 url,
-                json=data,
-                headers=headers,
-                timeout=self.timeout
+                content=orjson.dumps(data),
+                headers=headers
             )
-            
+
             response.raise_for_status()
-            result = response.json()
-            
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            
-            logger.warning(f"无法从响应中提取内容: {result}")
+
+            # msgspec按声明的结构单次C层解析，免去中间dict/list构建
+            try:
+                result = msgspec.json.decode(response.content, type=_ChatResponse)
+                if result.choices:
+                    return result.choices[0].message.content
+                logger.warning("响应中choices为空")
+                return None
+            except (msgspec.ValidationError, msgspec.DecodeError):
+                # 结构不符时退回通用解析，便于记录实际返回内容
+                result = orjson.loads(response.content)
+                logger.warning(f"无法从响应中提取内容: {result}")
+                return None
+
+        except httpx.TimeoutException:
+            logger.error(f"请求超时（{self.timeout}秒）")
+            return None
+        except httpx.HTTPStatusError as e:
+            logger.error(f"请求失败: {str(e)}")
+            logger.error(f"响应内容: {e.response.text}")
             return None
-            
         except Exception as e:
             logger.error(f"聊天请求失败: {str(e)}")
             return None
@@ -218,9 +388,8 @@ if __name__ == "__main__":
         model="deepseek-ai/DeepSeek-V3.1",
         default_prompt="你是一个专业的视频内容总结助手。请仔细阅读以下视频字幕内容，提取关键信息，生成一份结构化的总结，包括：1. 核心主题 2. 主要观点（3-5点）3. 关键结论。请使用简洁清晰的中文。"
     )
-    
+
     # 示例：生成总结
-    summary = client.summarize("A： 因为StringBuffer内部使用synchronized关键字对方法进行了同步处理，确保了多线程环境下对字符串的修改操作是线程安全的，避免了数据竞争和不一致的问题。而StringBuilder没有同步机制，在多线程环境下可能会导致不可预知的结果。TIPS： 如果需要在多线程环境下使用StringBuilder，可以通过外部同步机制（如使用锁）来保证线程安全，但这样会增加代码复杂性。<br>")
+    summary = asyncio.run(client.summarize("A： 因为StringBuffer内部使用synchronized关键字对方法进行了同步处理，确保了多线程环境下对字符串的修改操作是线程安全的，避免了数据竞争和不一致的问题。而StringBuilder没有同步机制，在多线程环境下可能会导致不可预知的结果。TIPS： 如果需要在多线程环境下使用StringBuilder，可以通过外部同步机制（如使用锁）来保证线程安全，但这样会增加代码复杂性。<br>"))
     if summary:
         print(f"总结: {summary}")
-
@@ -0,0 +1,134 @@
+"""
+本地Whisper语音识别客户端模块
+基于faster-whisper（CTranslate2量化推理）在进程内完成转录，
+免去远程/asr服务的网络往返和上传开销
+"""
+import asyncio
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from cache import SummaryCache, hash_file_async
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalWhisperClient:
+    """进程内faster-whisper客户端（与WhisperClient接口一致）"""
+
+    def __init__(
+        self,
+        model_name: str = "large-v3",
+        device: str = "auto",
+        compute_type: str = "int8",
+        cache: Optional[SummaryCache] = None
+    ):
+        """
+        初始化本地Whisper客户端（模型只加载一次，进程内复用）
+
+        Args:
+            model_name: faster-whisper模型名称（如 large-v3 / medium / small）
+            device: 推理设备（cuda / cpu / auto）
+            compute_type: 量化类型（int8 / int8_float16 / float16等）
+            cache: 转录结果缓存（以音频内容哈希为键），None则不缓存
+        """
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            logger.error("未安装faster-whisper，请先执行: pip install faster-whisper")
+            raise e
+
+        self.cache = cache
+        # 模型加载开销大（数秒到数十秒），只在初始化时做一次
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type)
+        logger.info(
+            f"初始化LocalWhisperClient，模型: {model_name}, "
+            f"设备: {device}, 量化: {compute_type}"
+        )
+
+    async def aclose(self):
+        """与WhisperClient保持接口一致（本地模型无需清理连接）"""
+
+    def _transcribe_sync(self, audio_path: str) -> Optional[str]:
+        """阻塞式转录（在线程池中执行，不占用事件循环）"""
+        segments, _ = self.model.transcribe(
+            audio_path,
+            beam_size=1,
+            vad_filter=True
+        )
+        text = " ".join(segment.text.strip() for segment in segments)
+        return text if text else None
+
+    async def transcribe(self, audio_file_path: str, output_format: str = "json") -> Optional[str]:
+        """
+        将音频文件转换为文本
+
+        Args:
+            audio_file_path: 本地音频文件路径
+            output_format: 保留参数，与远程客户端接口一致
+
+        Returns:
+            转换后的文本内容，失败返回None
+        """
+        audio_path = Path(audio_file_path)
+
+        # 检查文件是否存在
+        if not audio_path.exists():
+            logger.error(f"音频文件不存在: {audio_file_path}")
+            return None
+
+        # 检查文件是否为空
+        if audio_path.stat().st_size == 0:
+            logger.error(f"音频文件为空: {audio_file_path}")
+            return None
+
+        logger.info(f"开始本地转录音频文件: {audio_file_path}")
+
+        # 以音频内容的哈希为键查询缓存（哈希读取走aiofiles，不阻塞事件循环）
+        audio_hash = None
+        if self.cache:
+            audio_hash = await hash_file_async(str(audio_path))
+            cached = self.cache.get("whisper", audio_hash)
+            if cached:
+                return cached
+
+        try:
+            text = await asyncio.to_thread(self._transcribe_sync, str(audio_path))
+
+            if text:
+                logger.info(f"成功转录音频，文本长度: {len(text)}字符")
+                if self.cache and audio_hash:
+                    self.cache.set("whisper", audio_hash, text)
+                return text
+
+            logger.warning("转录结果为空")
+            return None
+
+        except Exception as e:
+            logger.error(f"转录过程发生错误: {str(e)}")
+            return None
+
+    async def transcribe_batch(
+        self,
+        audio_paths: List[str],
+        max_concurrency: int = 4
+    ) -> List[Optional[str]]:
+        """
+        批量转录多个音频片段
+
+        本地模型对同一设备的推理本质上是串行的，这里逐个转录
+        以避免多线程争抢显存/算力；接口与WhisperClient保持一致。
+
+        Args:
+            audio_paths: 音频文件路径列表
+            max_concurrency: 保留参数，与远程客户端接口一致
+
+        Returns:
+            与输入同序的转录文本列表（失败的片段为None）
+        """
+        if not audio_paths:
+            return []
+
+        logger.info(f"批量本地转录{len(audio_paths)}个片段")
+        return [await self.transcribe(path) for path in audio_paths]
@@ -0,0 +1,45 @@
+"""
+日志配置模块
+通过QueueHandler/QueueListener把日志写出移到后台线程，
+请求路径上的日志调用只做O(1)入队，不再同步写终端
+"""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+_listener = None
+
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """
+    初始化全局日志（整个进程只需调用一次，重复调用为空操作）
+
+    根logger挂一个QueueHandler，真正的格式化和终端输出
+    由后台QueueListener线程完成，避免业务线程在StreamHandler
+    的互斥锁和同步I/O上排队。
+
+    Args:
+        level: 根logger的日志级别
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -5,21 +5,22 @@ B站视频总结工具主程序
 import asyncio
 import configparser
 import logging
+import os
 import sys
 import shutil
+import tempfile
 from pathlib import Path
 from typing import Optional
 
 from bilix.sites.bilibili import DownloaderBilibili
+from cache import SummaryCache, hash_text
+from log_setup import setup_logging
 from whisper_client import WhisperClient
 from llm_client import LLMClient
 
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志（后台线程异步写出）
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -36,21 +37,75 @@ class BiliSummary:
         self.config_path = config_path
         self.config = self._load_config()
         
-        # 初始化客户端
-        self.whisper_client = WhisperClient(
-            base_url=self.config['whisper']['base_url'],
-            timeout=int(self.config['whisper']['timeout'])
+        # 内容寻址缓存：相同音频/文本的重复请求直接复用结果
+        self.cache = SummaryCache(
+            cache_dir=self.config.get('cache', 'dir', fallback='./.cache')
         )
-        
+
+        # 初始化客户端（backend=local时进程内加载faster-whisper，免去远程RPC）
+        whisper_backend = self.config['whisper'].get('backend', 'remote')
+        if whisper_backend == 'local':
+            from local_whisper_client import LocalWhisperClient
+            self.whisper_client = LocalWhisperClient(
+                model_name=self.config['whisper'].get('model', 'large-v3'),
+                device=self.config['whisper'].get('device', 'auto'),
+                compute_type=self.config['whisper'].get('compute_type', 'int8'),
+                cache=self.cache
+            )
+        else:
+            self.whisper_client = WhisperClient(
+                base_url=self.config['whisper']['base_url'],
+                timeout=int(self.config['whisper']['timeout']),
+                cache=self.cache,
+                connect_timeout=int(self.config['whisper'].get('connect_timeout', '5')),
+                max_retries=int(self.config['whisper'].get('max_retries', '3')),
+                trim_silence=self.config['whisper'].getboolean('trim_silence', fallback=True)
+            )
+
+        # 批量转录时同时在途的片段请求数
+        self.whisper_batch_size = int(
+            self.config['whisper'].get('batch_size', '4')
+        )
+
         self.llm_client = LLMClient(
             base_url=self.config['litellm']['base_url'],
             api_key=self.config['litellm']['api_key'],
             model=self.config['litellm']['model'],
             default_prompt=self.config['summary']['default_prompt'],
-            timeout=int(self.config['litellm']['timeout'])
+            timeout=int(self.config['litellm']['timeout']),
+            max_parallel=int(self.config['summary'].get('max_parallel', '4')),
+            cache=self.cache,
+            connect_timeout=int(self.config['litellm'].get('connect_timeout', '5')),
+            max_retries=int(self.config['litellm'].get('max_retries', '3'))
         )
-        
+
+        # 超过该字符数的转录文本走分块map-reduce总结
+        self.long_text_threshold = int(
+            self.config['summary'].get('long_text_threshold', '4000')
+        )
+
+        # 常驻下载器：跨请求复用B站HTTP会话（CDN解析+TLS握手只做一次），
+        # 由setup()/aclose()管理生命周期
+        self._downloader_cm: Optional[DownloaderBilibili] = None
+        self.downloader = None
+
         logger.info("BiliSummary初始化完成")
+
+    async def setup(self) -> None:
+        """创建常驻的DownloaderBilibili会话（重复调用为空操作）"""
+        if self.downloader is None:
+            self._downloader_cm = DownloaderBilibili()
+            self.downloader = await self._downloader_cm.__aenter__()
+            logger.info("下载器会话已建立")
+
+    async def aclose(self) -> None:
+        """关闭下载器会话和各客户端的连接池"""
+        if self._downloader_cm is not None:
+            await self._downloader_cm.__aexit__(None, None, None)
+            self._downloader_cm = None
+            self.downloader = None
+        await self.whisper_client.aclose()
+        await self.llm_client.aclose()
     
     def _load_config(self) -> configparser.ConfigParser:
         """
@@ -71,49 +126,64 @@ class BiliSummary:
         
         return config
     
+    async def warmup(self) -> None:
+        """
+        预热到下游服务的连接
+
+        对Whisper和LiteLLM各发一次尽力而为的GET，提前完成DNS解析和
+        TCP/TLS握手，首个真实请求直接复用连接池里的热连接。
+        """
+        for client in (self.whisper_client, self.llm_client):
+            http_client = getattr(client, '_client', None)
+            base_url = getattr(client, 'base_url', None)
+            if http_client is None or base_url is None:
+                continue
+            try:
+                await http_client.get(base_url)
+                logger.info(f"连接预热完成: {base_url}")
+            except Exception as e:
+                logger.debug("连接预热失败（忽略）: %s", str(e))
+
     async def download_audio(self, video_url: str, save_dir: str = "./tmp") -> Optional[str]:
         """
         从B站下载视频音频
-        
+
         Args:
             video_url: B站视频URL
-            save_dir: 保存目录（默认为./tmp，每次下载前会清空）
-            
+            save_dir: 保存目录（调用方负责保证目录独占与清理）
+
         Returns:
             下载的音频文件路径，失败返回None
         """
         try:
             logger.info(f"开始下载音频: {video_url}")
-            
-            # 清理并重建tmp目录
+
             save_path = Path(save_dir)
-            if save_path.exists():
-                logger.info(f"清理临时目录: {save_dir}")
-                shutil.rmtree(save_path)
-            
-            # 创建新的临时目录
             save_path.mkdir(parents=True, exist_ok=True)
-            logger.info(f"创建临时目录: {save_dir}")
-            
-            async with DownloaderBilibili() as downloader:
-                # 下载音频
-                await downloader.get_video(
-                    url=video_url,
-                    only_audio=True,
-                    path=save_dir
-                )
-            
-            # 查找下载的音频文件（支持多种音频格式）
-            audio_files = (
-                list(save_path.glob("**/*.m4a")) + 
-                list(save_path.glob("**/*.mp3")) + 
-                list(save_path.glob("**/*.aac")) +
-                list(save_path.glob("**/*.wav"))
+
+            # 复用常驻下载器会话（未建立时惰性创建一次）
+            await self.setup()
+            await self.downloader.get_video(
+                url=video_url,
+                only_audio=True,
+                path=save_dir
             )
             
-            if audio_files:
-                # 按修改时间排序，取最新的
-                latest_audio = max(audio_files, key=lambda p: p.stat().st_mtime)
+            # 查找下载的音频文件（支持多种音频格式）
+            # 单次os.walk遍历同时收集路径和mtime，避免多轮递归glob加逐个stat
+            audio_exts = {'.m4a', '.mp3', '.aac', '.wav'}
+            latest_audio = None
+            latest_mtime = 0.0
+            for root, _, files in os.walk(save_dir):
+                for name in files:
+                    if os.path.splitext(name)[1].lower() in audio_exts:
+                        file_path = os.path.join(root, name)
+                        mtime = os.stat(file_path).st_mtime
+                        if latest_audio is None or mtime > latest_mtime:
+                            latest_audio = Path(file_path)
+                            latest_mtime = mtime
+
+            if latest_audio:
                 logger.info(f"找到下载的音频文件: {latest_audio}")
                 
                 # 重命名为 temp.后缀名
@@ -137,47 +207,187 @@ class BiliSummary:
             logger.error(f"下载音频失败: {str(e)}")
             return None
     
-    def audio_to_text(self, audio_path: str) -> Optional[str]:
+    async def audio_to_text(self, audio_path: str) -> Optional[str]:
         """
         将音频转换为文本
-        
+
         Args:
             audio_path: 音频文件路径
-            
+
         Returns:
             转录的文本内容，失败返回None
         """
         logger.info(f"开始转录音频: {audio_path}")
-        return self.whisper_client.transcribe(audio_path)
-    
-    def text_to_summary(self, text: str, custom_prompt: Optional[str] = None) -> Optional[str]:
+        return await self.whisper_client.transcribe(audio_path)
+
+    async def text_to_summary(self, text: str, custom_prompt: Optional[str] = None) -> Optional[str]:
         """
         将文本生成总结
-        
+
         Args:
             text: 文本内容
             custom_prompt: 自定义提示词
-            
+
         Returns:
             生成的总结，失败返回None
         """
         logger.info("开始生成总结")
-        return self.llm_client.summarize(text, custom_prompt)
+        if len(text) > self.long_text_threshold:
+            logger.info(f"文本长度{len(text)}超过阈值{self.long_text_threshold}，使用分块总结")
+            return await self.llm_client.summarize_long(text, custom_prompt)
+        return await self.llm_client.summarize(text, custom_prompt)
     
+    async def _split_audio(self, audio_path: str, segment_seconds: int = 30) -> list:
+        """
+        使用ffmpeg将音频按固定时长切分为多个片段
+
+        Args:
+            audio_path: 音频文件路径
+            segment_seconds: 每个片段的时长（秒）
+
+        Returns:
+            片段路径列表（按顺序）；ffmpeg不可用或切分失败时返回原文件
+        """
+        if shutil.which("ffmpeg") is None:
+            logger.warning("未找到ffmpeg，跳过音频切分")
+            return [audio_path]
+
+        src = Path(audio_path)
+        seg_dir = src.parent / "segments"
+        seg_dir.mkdir(exist_ok=True)
+        seg_pattern = str(seg_dir / f"seg_%04d{src.suffix}")
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-y", "-i", str(src),
+                "-f", "segment", "-segment_time", str(segment_seconds),
+                "-c", "copy", seg_pattern,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            await proc.wait()
+
+            if proc.returncode != 0:
+                logger.warning(f"ffmpeg切分失败（返回码{proc.returncode}），使用完整音频")
+                return [audio_path]
+
+            segments = sorted(str(p) for p in seg_dir.glob(f"seg_*{src.suffix}"))
+            if not segments:
+                return [audio_path]
+
+            logger.info(f"音频已切分为{len(segments)}个片段")
+            return segments
+
+        except Exception as e:
+            logger.warning(f"音频切分出错: {str(e)}，使用完整音频")
+            return [audio_path]
+
+    async def _producer_download(
+        self,
+        video_url: str,
+        save_dir: str,
+        queue_out: asyncio.Queue
+    ) -> None:
+        """
+        流水线生产者：下载音频并切分，把片段路径推入队列
+
+        下载完成的片段立即入队，下游转录阶段无需等待全部准备完毕。
+        以None作为结束哨兵。
+        """
+        try:
+            audio_path = await self.download_audio(video_url, save_dir)
+            if not audio_path:
+                logger.error("下载音频失败，流程终止")
+                return
+
+            for segment in await self._split_audio(audio_path):
+                await queue_out.put(segment)
+        finally:
+            await queue_out.put(None)
+
+    async def _stage_transcribe(
+        self,
+        queue_in: asyncio.Queue,
+        queue_out: asyncio.Queue
+    ) -> None:
+        """
+        流水线转录阶段：片段一到达就发起转录任务（信号量限制并发数），
+        收到哨兵后按输入顺序收集结果并推入下游队列
+        """
+        try:
+            # 每个片段立即起任务，保留与下载阶段的重叠；
+            # 并发在途请求数由batch_size限制
+            semaphore = asyncio.Semaphore(self.whisper_batch_size)
+
+            async def _transcribe_one(segment: str) -> Optional[str]:
+                async with semaphore:
+                    return await self.audio_to_text(segment)
+
+            segments = []
+            tasks = []
+            while True:
+                segment = await queue_in.get()
+                if segment is None:
+                    break
+                segments.append(segment)
+                tasks.append(asyncio.create_task(_transcribe_one(segment)))
+
+            for segment, task in zip(segments, tasks):
+                text = await task
+                if text:
+                    await queue_out.put(text)
+                else:
+                    logger.warning(f"片段转录失败，已跳过: {segment}")
+        finally:
+            await queue_out.put(None)
+
+    async def _stage_summarize(
+        self,
+        queue_in: asyncio.Queue,
+        custom_prompt: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        流水线总结阶段：收集转录文本，生成最终总结
+
+        Returns:
+            生成的总结内容，失败返回None
+        """
+        texts = []
+        while True:
+            text = await queue_in.get()
+            if text is None:
+                break
+            texts.append(text)
+
+        if not texts:
+            logger.error("未收到任何转录文本，流程终止")
+            return None
+
+        full_text = "\n".join(texts)
+        logger.info(f"转录文本预览（前200字）: {full_text[:200]}...")
+
+        return await self.text_to_summary(full_text, custom_prompt)
+
     async def process_video(
-        self, 
-        video_url: str, 
-        save_dir: str = "./downloads",
+        self,
+        video_url: str,
         custom_prompt: Optional[str] = None
     ) -> Optional[str]:
         """
         完整处理流程：下载 -> 转录 -> 总结
-        
+
+        三个阶段通过asyncio.TaskGroup + asyncio.Queue组成流水线并发执行：
+        音频片段一旦下载切分完成就开始转录，转录结果陆续汇入总结阶段，
+        避免网络密集型阶段互相串行等待。
+
+        每次调用使用独立的临时目录，并发请求互不冲突，
+        退出时由上下文管理器一次性清理。临时目录优先建在
+        /dev/shm（tmpfs）上，下载与切分的中间文件读写走内存。
+
         Args:
             video_url: B站视频URL
-            save_dir: 下载保存目录
             custom_prompt: 自定义总结提示词
-            
+
         Returns:
             生成的总结内容，失败返回None
         """
@@ -185,50 +395,46 @@ class BiliSummary:
         logger.info("开始处理视频总结任务")
         logger.info(f"视频URL: {video_url}")
         logger.info("=" * 50)
-        
-        summary = None
-        tmp_dir = "./tmp"
-        
-        try:
-            # 步骤1：下载音频（使用tmp_dir）
-            audio_path = await self.download_audio(video_url, tmp_dir)
-            if not audio_path:
-                logger.error("下载音频失败，流程终止")
-                return None
-            
-            # 步骤2：转录音频
-            text = self.audio_to_text(audio_path)
-            if not text:
-                logger.error("转录音频失败，流程终止")
-                return None
-            
-            logger.info(f"转录文本预览（前200字）: {text[:200]}...")
-            
-            # 步骤3：生成总结
-            summary = self.text_to_summary(text, custom_prompt)
+
+        # URL级缓存：同一视频（服务端已归一化为BV号形式）的重复请求
+        # 直接返回总结，连最昂贵的下载步骤都不触发
+        url_hash = hash_text(video_url, custom_prompt or "")
+        cached = self.cache.get("url", url_hash)
+        if cached:
+            return cached
+
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        with tempfile.TemporaryDirectory(prefix="bili_summary_", dir=shm_dir) as tmp_dir:
+            queue_audio: asyncio.Queue = asyncio.Queue()
+            queue_text: asyncio.Queue = asyncio.Queue()
+
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(
+                    self._producer_download(video_url, tmp_dir, queue_audio)
+                )
+                tg.create_task(
+                    self._stage_transcribe(queue_audio, queue_text)
+                )
+                summarize_task = tg.create_task(
+                    self._stage_summarize(queue_text, custom_prompt)
+                )
+
+            summary = summarize_task.result()
             if not summary:
                 logger.error("生成总结失败，流程终止")
                 return None
-            
+
+            self.cache.set("url", url_hash, summary)
+
             logger.info("=" * 50)
             logger.info("视频总结任务完成")
             logger.info("=" * 50)
-            
+
             return summary
-            
-        finally:
-            # 清理临时目录和下载目录
-            for dir_path in [tmp_dir, save_dir]:
-                if Path(dir_path).exists():
-                    try:
-                        shutil.rmtree(dir_path)
-                        logger.info(f"已清理目录: {dir_path}")
-                    except Exception as e:
-                        logger.warning(f"清理目录失败 {dir_path}: {str(e)}")
     
-    def process_audio_file(
-        self, 
-        audio_path: str, 
+    async def process_audio_file(
+        self,
+        audio_path: str,
         custom_prompt: Optional[str] = None
     ) -> Optional[str]:
         """
@@ -247,15 +453,15 @@ class BiliSummary:
         logger.info("=" * 50)
         
         # 步骤1：转录音频
-        text = self.audio_to_text(audio_path)
+        text = await self.audio_to_text(audio_path)
         if not text:
             logger.error("转录音频失败，流程终止")
             return None
-        
+
         logger.info(f"转录文本预览（前200字）: {text[:200]}...")
-        
+
         # 步骤2：生成总结
-        summary = self.text_to_summary(text, custom_prompt)
+        summary = await self.text_to_summary(text, custom_prompt)
         if not summary:
             logger.error("生成总结失败，流程终止")
             return None
@@ -271,25 +477,28 @@ async def main():
     """主函数示例"""
     # 初始化BiliSummary
     bili_summary = BiliSummary()
-    
-    # 示例1：处理B站视频URL
-    video_url = "https://www.bilibili.com/video/BV1THstzuEZ9/?spm_id_from=333.1007.tianma.2-2-5.click"
-    # audio_path = await bili_summary.download_audio(video_url)
-    # print(audio_path)
-    summary = await bili_summary.process_video(video_url)
-    
-    if summary:
-        print("\n" + "=" * 50)
-        print("视频总结:")
-        print("=" * 50)
-        print(summary)
-        print("=" * 50)
-    
-    # 示例2：处理本地音频文件
-    # audio_path = "/path/to/your/audio.mp3"
-    # summary = bili_summary.process_audio_file(audio_path)
-    # if summary:
-    #     print(f"\n音频总结:\n{summary}")
+
+    try:
+        # 示例1：处理B站视频URL
+        video_url = "https://www.bilibili.com/video/BV1THstzuEZ9/?spm_id_from=333.1007.tianma.2-2-5.click"
+        # audio_path = await bili_summary.download_audio(video_url)
+        # print(audio_path)
+        summary = await bili_summary.process_video(video_url)
+
+        if summary:
+            print("\n" + "=" * 50)
+            print("视频总结:")
+            print("=" * 50)
+            print(summary)
+            print("=" * 50)
+
+        # 示例2：处理本地音频文件
+        # audio_path = "/path/to/your/audio.mp3"
+        # summary = await bili_summary.process_audio_file(audio_path)
+        # if summary:
+        #     print(f"\n音频总结:\n{summary}")
+    finally:
+        await bili_summary.aclose()
 
 
 if __name__ == "__main__":
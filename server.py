@@ -1,44 +1,90 @@
 """
-Flask REST API服务器
+FastAPI REST API服务器
 提供B站视频总结的HTTP接口
 """
 import asyncio
 import logging
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import re
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from log_setup import setup_logging
 from main import BiliSummary
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志（后台线程异步写出）
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# 创建Flask应用
-app = Flask(__name__)
-CORS(app)  # 启用CORS
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时加载BiliSummary并预热下游连接，首个请求不再承担初始化开销"""
+    app.state.bili_summary = BiliSummary()
+    await app.state.bili_summary.setup()
+    await app.state.bili_summary.warmup()
+    logger.info("BiliSummary已就绪")
+    yield
+    await app.state.bili_summary.aclose()
+
+
+# 创建FastAPI应用（orjson序列化响应）
+app = FastAPI(
+    title="B站视频总结",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
+
+# 启用CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# 在途请求合并表：相同URL的并发请求共享同一个处理任务，
+# 避免重复下载/转录/总结（缓存尚未写入时的补充手段）
+_inflight: dict = {}
+
+# BV号提取正则（模块加载时编译一次）
+_BV_RE = re.compile(r'(BV[0-9A-Za-z]{10})')
+
 
-# 初始化BiliSummary（全局单例）
-bili_summary = None
+def canonical_url(url: str) -> str:
+    """
+    把B站视频URL归一化为纯BV号形式
+
+    去掉spm_id_from、vd_source等跟踪参数，仅保留视频标识，
+    使只差分析参数的URL能命中同一个在途任务和缓存条目。
 
-def get_bili_summary():
-    """获取或创建BiliSummary实例"""
-    global bili_summary
-    if bili_summary is None:
-        bili_summary = BiliSummary()
-    return bili_summary
+    Args:
+        url: 原始视频URL
 
-@app.route('/api/summary_bili', methods=['POST'])
-def summary_bili():
+    Returns:
+        归一化后的URL；未匹配到BV号时原样返回
+    """
+    match = _BV_RE.search(url)
+    if match:
+        return f"https://www.bilibili.com/video/{match.group(1)}"
+    return url
+
+
+class SummaryRequest(BaseModel):
+    """视频总结请求体"""
+    url: str
+
+
+@app.post('/api/summary_bili')
+async def summary_bili(req: SummaryRequest):
     """
     B站视频总结接口
-    
+
     请求格式：
     {
         "url": "https://www.bilibili.com/video/BV..."
     }
-    
+
     响应格式：
     {
         "success": true,
@@ -51,65 +97,92 @@ def summary_bili():
     }
     """
     try:
-        # 获取请求数据
-        data = request.get_json()
-        if not data or 'url' not in data:
-            return jsonify({
-                'success': False,
-                'error': '请求参数错误：缺少url字段'
-            }), 400
-        
-        video_url = data['url']
-        
+        video_url = req.url
+
         # 验证URL格式
         if not video_url.startswith('https://www.bilibili.com/video'):
-            return jsonify({
-                'success': False,
-                'error': 'URL格式错误：必须是B站视频链接'
-            }), 400
-        
+            return ORJSONResponse(
+                status_code=400,
+                content={
+                    'success': False,
+                    'error': 'URL格式错误：必须是B站视频链接'
+                }
+            )
+
         logger.info(f"收到总结请求: {video_url}")
-        
-        # 处理视频总结（异步转同步）
-        summary_tool = get_bili_summary()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        summary = loop.run_until_complete(
-            summary_tool.process_video(video_url)
-        )
-        loop.close()
-        
+
+        # 归一化URL：跟踪参数不同但视频相同的请求共享任务和缓存
+        video_url = canonical_url(video_url)
+
+        # 处理视频总结：相同URL的在途任务直接复用，不重复触发流水线
+        task = _inflight.get(video_url)
+        if task is None:
+            summary_tool = app.state.bili_summary
+            task = asyncio.create_task(summary_tool.process_video(video_url))
+            _inflight[video_url] = task
+            task.add_done_callback(lambda _: _inflight.pop(video_url, None))
+        else:
+            logger.info(f"合并到在途的相同请求: {video_url}")
+
+        summary = await task
+
         if summary:
             logger.info("总结生成成功")
-            return jsonify({
+            return {
                 'success': True,
                 'summary': summary
-            })
+            }
         else:
             logger.error("总结生成失败")
-            return jsonify({
-                'success': False,
-                'error': '总结生成失败，请检查视频链接或稍后重试'
-            }), 500
-            
+            return ORJSONResponse(
+                status_code=500,
+                content={
+                    'success': False,
+                    'error': '总结生成失败，请检查视频链接或稍后重试'
+                }
+            )
+
     except Exception as e:
         logger.error(f"处理请求时发生错误: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': f'服务器错误: {str(e)}'
-        }), 500
+        return ORJSONResponse(
+            status_code=500,
+            content={
+                'success': False,
+                'error': f'服务器错误: {str(e)}'
+            }
+        )
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
+@app.get('/api/health')
+async def health_check():
     """健康检查接口"""
-    return jsonify({'status': 'ok'})
+    return {'status': 'ok'}
 
 if __name__ == '__main__':
-    # 使用Uvicorn运行（需要ASGI适配器）
+    import os
     import uvicorn
-    from asgiref.wsgi import WsgiToAsgi
-    
-    asgi_app = WsgiToAsgi(app)
-    logger.info("启动服务器 http://localhost:5000")
-    uvicorn.run(asgi_app, host="0.0.0.0", port=5000)
 
+    # uvloop/httptools在I/O密集负载下比默认实现快约2倍，未安装时自动回退
+    try:
+        import uvloop  # noqa: F401
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "auto"
+    try:
+        import httptools  # noqa: F401
+        http_impl = "httptools"
+    except ImportError:
+        http_impl = "auto"
+
+    # 多工作进程利用多核并行处理请求（每个进程有独立的在途合并表，
+    # 跨进程的重复请求由磁盘缓存兜底）
+    workers = int(os.environ.get('SUMMARY_WORKERS', os.cpu_count() or 1))
+
+    logger.info(f"启动服务器 http://localhost:5000（{workers}个工作进程）")
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=5000,
+        workers=workers,
+        loop=loop_impl,
+        http=http_impl
+    )
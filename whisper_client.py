@@ -2,105 +2,245 @@
 Whisper语音识别客户端模块
 用于将音频文件转换为文本
 """
-import requests
+import asyncio
+import httpx
 import logging
+import mmap
+import msgspec
+import orjson
+import random
+import shutil
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+
+from cache import SummaryCache, hash_file_async
 
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
+class _AsrResponse(msgspec.Struct):
+    """Whisper /asr接口的JSON响应"""
+    text: str = ""
+
+
 class WhisperClient:
     """Whisper API客户端"""
-    
-    def __init__(self, base_url: str, timeout: int = 300):
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: int = 300,
+        cache: Optional[SummaryCache] = None,
+        connect_timeout: int = 5,
+        max_retries: int = 3,
+        trim_silence: bool = True
+    ):
         """
         初始化Whisper客户端
-        
+
         Args:
             base_url: Whisper服务的基础URL
             timeout: 请求超时时间（秒）
+            cache: 转录结果缓存（以音频内容哈希为键），None则不缓存
+            connect_timeout: 建立连接的超时时间（秒），远小于读超时
+            max_retries: 连接/超时类错误的最大尝试次数
+            trim_silence: 预处理时是否剔除静音段（减少上传字节和编码帧数）
         """
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
+        self.cache = cache
+        # 至少尝试一次，配置为0/负数时不会出现"零次尝试"的无效状态
+        self.max_retries = max(1, max_retries)
+        self.trim_silence = trim_silence
+        # 持久连接池：复用TCP/TLS连接，避免每次上传重新握手
+        # 连接超时收紧到秒级，坏节点快速失败后走重试而非拖满整个读超时
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+            http2=True
+        )
         logger.info(f"初始化WhisperClient，服务地址: {self.base_url}")
-    
-    def transcribe(self, audio_file_path: str, output_format: str = "json") -> Optional[str]:
+
+    async def aclose(self):
+        """关闭底层HTTP连接池"""
+        await self._client.aclose()
+
+    async def _preprocess(self, audio_path: Path) -> Optional[bytes]:
+        """
+        上传前将音频转码为16kHz单声道Opus
+
+        Whisper服务端内部统一重采样到16kHz单声道，原始44.1/48kHz立体声
+        音频约90%的字节会被服务端丢弃。本地预先转码可将上传体积缩小
+        5-10倍，同时降低服务端解码开销。启用trim_silence时顺带用
+        silenceremove滤镜剔除片头片尾及超过1秒的内部静音段，
+        让编码器只处理有语音的帧。
+
+        转码结果从ffmpeg的stdout管道直接读取，不落盘中转，
+        省去一次写盘和一次回读。
+
+        Args:
+            audio_path: 原始音频文件路径
+
+        Returns:
+            转码后的音频字节；ffmpeg不可用或转码失败时返回None
+        """
+        if shutil.which("ffmpeg") is None:
+            logger.warning("未找到ffmpeg，跳过音频预处理，直接上传原始文件")
+            return None
+
+        cmd = ["ffmpeg", "-i", str(audio_path), "-ac", "1", "-ar", "16000"]
+        if self.trim_silence:
+            cmd += [
+                "-af",
+                "silenceremove=start_periods=1:stop_periods=-1"
+                ":stop_duration=1:stop_threshold=-40dB"
+            ]
+        cmd += ["-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1"]
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            audio_bytes, _ = await proc.communicate()
+
+            if proc.returncode != 0 or not audio_bytes:
+                logger.warning(f"音频转码失败（返回码{proc.returncode}），上传原始文件")
+                return None
+
+            logger.info(
+                f"音频预处理完成: {audio_path.stat().st_size} -> "
+                f"{len(audio_bytes)}字节"
+            )
+            return audio_bytes
+
+        except Exception as e:
+            logger.warning(f"音频预处理出错: {str(e)}，上传原始文件")
+            return None
+
+    async def _post_audio(self, url: str, params: dict, name: str, content) -> httpx.Response:
+        """
+        带退避重试的音频上传
+
+        Args:
+            url: 请求URL
+            params: 查询参数
+            name: 上传的文件名
+            content: 音频内容（bytes或可seek的文件对象）
+
+        Returns:
+            httpx响应对象（重试耗尽后抛出最后一次异常）
+        """
+        last_exc = None
+        for attempt in range(self.max_retries):
+            try:
+                # 重试前回卷文件指针（bytes无需处理）
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                files = {'audio_file': (name, content, 'audio/*')}
+                return await self._client.post(url, params=params, files=files)
+            except (httpx.ConnectError, httpx.ConnectTimeout,
+                    httpx.ReadTimeout, httpx.PoolTimeout) as e:
+                last_exc = e
+                if attempt + 1 >= self.max_retries:
+                    break
+                delay = min(2 ** attempt, 8) + random.uniform(0, 1)
+                logger.warning(
+                    f"上传失败（{type(e).__name__}），{delay:.1f}秒后重试 "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                await asyncio.sleep(delay)
+        raise last_exc
+
+    async def transcribe(self, audio_file_path: str, output_format: str = "json") -> Optional[str]:
         """
         将音频文件转换为文本
-        
+
         Args:
             audio_file_path: 本地音频文件路径
             output_format: 输出格式，默认为json
-            
+
         Returns:
             转换后的文本内容，失败返回None
         """
         audio_path = Path(audio_file_path)
-        
+
         # 检查文件是否存在
         if not audio_path.exists():
             logger.error(f"音频文件不存在: {audio_file_path}")
             return None
-        
+
         # 检查文件是否为空
         if audio_path.stat().st_size == 0:
             logger.error(f"音频文件为空: {audio_file_path}")
             return None
-        
+
         logger.info(f"开始转录音频文件: {audio_file_path}")
-        
+
+        # 以原始音频内容的哈希为键查询缓存，命中则跳过转码和上传
+        # （哈希读取走aiofiles，不阻塞事件循环）
+        audio_hash = None
+        if self.cache:
+            audio_hash = await hash_file_async(str(audio_path))
+            cached = self.cache.get("whisper", audio_hash)
+            if cached:
+                return cached
+
+        # 转码为16kHz单声道Opus（经stdout管道，不落盘），减少上传字节数
+        audio_bytes = await self._preprocess(audio_path)
+
         try:
             # 构建请求URL
             url = f"{self.base_url}/asr"
             params = {"output": output_format}
-            
-            # 打开文件并发送请求
-            with open(audio_path, 'rb') as audio_file:
-                files = {'audio_file': (audio_path.name, audio_file, 'audio/*')}
-                
-                logger.debug(f"发送请求到: {url}?output={output_format}")
-                response = requests.post(
-                    url,
-                    params=params,
-                    files=files,
-                    timeout=self.timeout
+            logger.debug("发送请求到: %s?output=%s", url, output_format)
+
+            if audio_bytes is not None:
+                # 转码结果直接从内存上传
+                response = await self._post_audio(
+                    url, params, f"{audio_path.stem}_16k.ogg", audio_bytes
                 )
-            
+            else:
+                # 未经转码的原始文件走mmap流式上传：httpx按块读取，
+                # 内存占用恒定，大文件不会被整体读入堆内存
+                with open(audio_path, 'rb') as audio_file:
+                    with mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        response = await self._post_audio(
+                            url, params, audio_path.name, mapped
+                        )
+
             # 检查响应状态
             response.raise_for_status()
-            
-            # 解析JSON响应
-            result = response.json()
-            logger.debug(f"API响应: {result}")
-            
-            # 提取文本内容
-            # 根据Whisper API的响应格式，文本通常在'text'字段中
-            if isinstance(result, dict):
-                text = result.get('text', '')
-            elif isinstance(result, str):
-                text = result
-            else:
-                logger.warning(f"未知的响应格式: {type(result)}")
-                text = str(result)
-            
+
+            # 按声明结构单次解析响应，文本在'text'字段中；
+            # 结构不符（如纯字符串响应）时退回通用解析
+            try:
+                text = msgspec.json.decode(response.content, type=_AsrResponse).text
+            except (msgspec.ValidationError, msgspec.DecodeError):
+                result = orjson.loads(response.content)
+                # 惰性格式化：debug未开启时不会序列化完整响应
+                logger.debug("API响应: %s", result)
+                if isinstance(result, str):
+                    text = result
+                else:
+                    logger.warning(f"未知的响应格式: {type(result)}")
+                    text = str(result)
+
             if text:
                 logger.info(f"成功转录音频，文本长度: {len(text)}字符")
+                if self.cache and audio_hash:
+                    self.cache.set("whisper", audio_hash, text)
                 return text
             else:
                 logger.warning("转录结果为空")
                 return None
-                
-        except requests.exceptions.Timeout:
+
+        except httpx.TimeoutException:
             logger.error(f"请求超时（{self.timeout}秒）")
             return None
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"请求失败: {str(e)}")
             return None
         except Exception as e:
@@ -108,12 +248,44 @@ class WhisperClient:
             return None
 
 
+    async def transcribe_batch(
+        self,
+        audio_paths: List[str],
+        max_concurrency: int = 4
+    ) -> List[Optional[str]]:
+        """
+        批量转录多个音频片段
+
+        服务端的/asr接口一次只接受单个文件，这里通过并发多路请求
+        （信号量限制并发数）摊薄每次请求的往返开销，让服务端
+        多个推理批次重叠执行。
+
+        Args:
+            audio_paths: 音频文件路径列表
+            max_concurrency: 最大并发请求数
+
+        Returns:
+            与输入同序的转录文本列表（失败的片段为None）
+        """
+        if not audio_paths:
+            return []
+
+        logger.info(f"批量转录{len(audio_paths)}个片段，最大并发{max_concurrency}")
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _one(path: str) -> Optional[str]:
+            async with semaphore:
+                return await self.transcribe(path)
+
+        return list(await asyncio.gather(*[_one(p) for p in audio_paths]))
+
+
 if __name__ == "__main__":
     # 测试代码
     client = WhisperClient(base_url="http://10.18.188.89:9000")
-    
+
     # 示例：转录音频文件
-    text = client.transcribe(r"C:\Users\m1876\Desktop\project\pyutils\biliSummary\downloads\1.aac")
+    text = asyncio.run(client.transcribe(r"C:\Users\m1876\Desktop\project\pyutils\biliSummary\downloads\1.aac"))
     if text:
         print(f"转录结果: {text}")
-